@@ -6,14 +6,27 @@ Also runs as a Flask server with:
     GET  /status    — health check
 """
 
-import base64
-import json
+import hashlib
+import mmap
 import os
 import re
 import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from io import BytesIO
 
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from flask import Flask, request, jsonify
+from PIL import Image, UnidentifiedImageError
+
+try:
+    import pybase64 as base64  # SIMD-accelerated, drop-in compatible API
+except ImportError:
+    import base64
 
 from sheets_client import SheetsClient
 from tools.logger_tool import log_document
@@ -26,6 +39,72 @@ OCR_URL = os.environ.get("OCR_URL", "http://localhost:8080/v1/chat/completions")
 SPREADSHEET_NAME = os.environ.get("SPREADSHEET_NAME", "OCR Agent")
 CREDENTIALS_PATH = os.environ.get("GOOGLE_CREDENTIALS_PATH", None)
 
+
+class _OCRRetry(Retry):
+    """Exponential backoff clamped to [0.5s, 8s] between OCR server retries."""
+
+    BACKOFF_MIN = 0.5
+
+    def get_backoff_time(self) -> float:
+        return max(self.BACKOFF_MIN, super().get_backoff_time())
+
+
+# Transient overload (429) and gateway errors from the OCR server are retried
+# with backoff instead of failing the whole user request. Only connect
+# failures and those statuses are retried: a read timeout means the server is
+# still busy generating, and re-sending the POST would only add to its load.
+_RETRY = _OCRRetry(
+    total=3,
+    connect=3,
+    read=False,
+    other=0,
+    backoff_factor=0.5,
+    backoff_max=8,
+    status_forcelist=(429, 500, 502, 503, 504),
+    allowed_methods=frozenset(["POST"]),
+    raise_on_status=False,
+)
+
+# Shared keep-alive session so every OCR / classify call reuses a pooled
+# connection to the OCR server instead of opening a new socket.
+_SESSION = requests.Session()
+_SESSION.mount(
+    "http://",
+    HTTPAdapter(pool_connections=16, pool_maxsize=64, max_retries=_RETRY),
+)
+_SESSION.headers["Connection"] = "keep-alive"
+
+# Bound in-flight OCR server calls to what the model server can handle;
+# excess requests queue here instead of piling up on the backend.
+OCR_CONCURRENCY = int(os.environ.get("OCR_CONCURRENCY", "2"))
+_OCR_SLOTS = threading.BoundedSemaphore(OCR_CONCURRENCY)
+
+# Longest image side sent to the model. GLM-OCR reads text fine at 1-2 MP,
+# so larger phone photos are shrunk before base64-encoding.
+MAX_IMAGE_SIDE = int(os.environ.get("MAX_IMAGE_SIDE", "1600"))
+
+# Lazily-built SheetsClient shared by all requests (see get_sheets()).
+_SHEETS: SheetsClient | None = None
+_SHEETS_LOCK = threading.Lock()
+
+_MIME_MAP = {
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+    ".gif": "image/gif",
+    ".webp": "image/webp",
+    ".bmp": "image/bmp",
+}
+
+_JSON_OBJ_RE = re.compile(r"\{.*\}", re.DOTALL)
+
+# Cheap pre-filter: OCR text with none of these hints is never a receipt,
+# so it is logged directly without a classification round-trip.
+_RECEIPT_HINT_RE = re.compile(
+    r"\b(?:total|subtotal|vat|tax|amount)\b|[$€£¥]|合计|总计|金额", re.IGNORECASE
+)
+MIN_RECEIPT_CHARS = 20
+
 CLASSIFICATION_PROMPT = """\
 You are a document classifier. Given the following OCR text extracted from an image, do two things:
 
@@ -56,8 +135,90 @@ OCR TEXT:
 # Core pipeline functions
 # ---------------------------------------------------------------------------
 
-def ocr_image(image_data_url: str) -> str:
-    """Send an image (as data URL) to the local OCR server and return raw text."""
+class _SingleFlight:
+    """Collapse concurrent calls that share a key into one execution.
+
+    The first caller for a key runs the function; callers arriving while it
+    is in flight wait for and share its result (or exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict[str, Future] = {}
+
+    def do(self, key: str, fn):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        if leader:
+            try:
+                future.set_result(fn())
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                with self._lock:
+                    del self._calls[key]
+        return future.result()
+
+
+class _LRUCache:
+    """Small thread-safe LRU mapping from content digests to results."""
+
+    def __init__(self, maxsize: int = 128):
+        self.maxsize = maxsize
+        self._data: OrderedDict[str, object] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def put(self, key: str, value) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+_OCR_FLIGHTS = _SingleFlight()
+
+# Resubmitted images (double taps, retries after a network error) and
+# repeated OCR texts are answered from memory instead of the model.
+_OCR_CACHE = _LRUCache(maxsize=128)
+_CLASSIFY_CACHE = _LRUCache(maxsize=128)
+
+
+def _digest(data: bytes) -> str:
+    """Short content hash used to key the coalescer and result caches."""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def _chat_completion(payload: dict) -> str:
+    """POST *payload* to the OCR server and return the assistant message."""
+    with _OCR_SLOTS:
+        resp = _SESSION.post(OCR_URL, json=payload, timeout=300)
+    resp.raise_for_status()
+    return resp.json()["choices"][0]["message"]["content"]
+
+
+def ocr_image(image: str | tuple[str, str], use_cache: bool = True) -> str:
+    """Send an image to the local OCR server and return raw text.
+
+    *image* is either a data URL or a ``(mime, base64)`` pair; the pair is
+    joined into a data URL only here, when the payload is built. Results are
+    cached by image content unless *use_cache* is False.
+    """
+    if isinstance(image, tuple):
+        mime, b64 = image
+        image_data_url = f"data:{mime};base64,{b64}"
+    else:
+        image_data_url = image
     payload = {
         "messages": [
             {
@@ -71,13 +232,33 @@ def ocr_image(image_data_url: str) -> str:
         "max_tokens": 4096,
         "temperature": 0.1,
     }
-    resp = requests.post(OCR_URL, json=payload, timeout=300)
-    resp.raise_for_status()
-    return resp.json()["choices"][0]["message"]["content"]
+    key = _digest(image_data_url.encode("ascii"))
+    if use_cache:
+        cached = _OCR_CACHE.get(key)
+        if cached is not None:
+            return cached
 
+    # Identical images submitted concurrently (double taps, client retries)
+    # share a single OCR server call.
+    raw_text = _OCR_FLIGHTS.do(key, lambda: _chat_completion(payload))
+    _OCR_CACHE.put(key, raw_text)
+    return raw_text
 
-def classify_text(raw_text: str) -> dict:
+
+def classify_text(raw_text: str, use_cache: bool = True) -> dict:
     """Send OCR text back to the model for classification + extraction."""
+    key = _digest(raw_text.encode("utf-8"))
+    if use_cache:
+        cached = _CLASSIFY_CACHE.get(key)
+        if cached is not None:
+            return dict(cached)
+    classification = _classify_uncached(raw_text)
+    _CLASSIFY_CACHE.put(key, classification)
+    return dict(classification)
+
+
+def _classify_uncached(raw_text: str) -> dict:
+    """Ask the model to classify *raw_text* and parse its JSON reply."""
     payload = {
         "messages": [
             {
@@ -87,78 +268,169 @@ def classify_text(raw_text: str) -> dict:
         ],
         "max_tokens": 2048,
         "temperature": 0.1,
+        "response_format": {"type": "json_object"},
     }
-    resp = requests.post(OCR_URL, json=payload, timeout=300)
-    resp.raise_for_status()
-    reply = resp.json()["choices"][0]["message"]["content"]
-
-    # Try to extract JSON from the response
-    # Strip markdown code fences if present
-    cleaned = re.sub(r"```(?:json)?\s*", "", reply)
-    cleaned = cleaned.strip().rstrip("`")
+    reply = _chat_completion(payload)
 
     try:
-        return json.loads(cleaned)
-    except json.JSONDecodeError:
-        # Try to find JSON object in the text
-        match = re.search(r"\{.*\}", cleaned, re.DOTALL)
-        if match:
-            try:
-                return json.loads(match.group())
-            except json.JSONDecodeError:
-                pass
-        # Fallback: treat as OTHER
-        return {"classification": "OTHER", "summary": reply[:100]}
+        return orjson.loads(reply)
+    except orjson.JSONDecodeError:
+        pass
+    # Servers without JSON mode may still wrap the object in prose or fences
+    match = _JSON_OBJ_RE.search(reply)
+    if match:
+        try:
+            return orjson.loads(match.group())
+        except orjson.JSONDecodeError:
+            pass
+    # Fallback: treat as OTHER
+    print(f"[agent] Classification reply contains no valid JSON object: {reply[:80]!r}")
+    return {"classification": "OTHER", "summary": reply[:100]}
+
+
+def _downscale_to_jpeg(img: Image.Image) -> bytes | None:
+    """Return *img* shrunk to MAX_IMAGE_SIDE as JPEG bytes, or None if it fits."""
+    if max(img.size) <= MAX_IMAGE_SIDE:
+        return None
+    img.thumbnail((MAX_IMAGE_SIDE, MAX_IMAGE_SIDE), Image.Resampling.BICUBIC)
+    if img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    out = BytesIO()
+    img.save(out, format="JPEG", quality=85)
+    return out.getvalue()
+
+
+def _downscaled(fp) -> bytes | None:
+    """Open the image in file-like *fp* and return _downscale_to_jpeg's result.
+
+    Unreadable images yield None, i.e. they are sent unchanged.
+    """
+    try:
+        with Image.open(fp) as img:
+            return _downscale_to_jpeg(img)
+    # Some format probes seek past the end of a short mmap, which raises
+    # ValueError rather than OSError
+    except (UnidentifiedImageError, OSError, ValueError):
+        return None
+
+
+def _maybe_downscale(image_bytes: bytes, mime: str) -> tuple[str, bytes]:
+    """Shrink images larger than MAX_IMAGE_SIDE and re-encode them as JPEG.
+
+    Returns ``(mime, image_bytes)``; small or unreadable images are passed
+    through unchanged.
+    """
+    small = _downscaled(BytesIO(image_bytes))
+    if small is None:
+        return mime, image_bytes
+    return "image/jpeg", small
+
+
+def _maybe_downscale_stream(stream, mime: str) -> tuple[str, bytes]:
+    """Like _maybe_downscale, but decodes straight from a seekable stream.
+
+    Large uploads are never materialized as a full ``bytes`` copy; only
+    images that already fit are read out verbatim.
+    """
+    small = _downscaled(stream)
+    if small is None:
+        stream.seek(0)
+        return mime, stream.read()
+    return "image/jpeg", small
+
+
+def encode_image_bytes(mime: str, image_bytes: bytes) -> tuple[str, str]:
+    """Downscale raw image bytes if needed and return a ``(mime, base64)`` pair.
+
+    The image is base64-encoded exactly once; the pair is accepted by
+    ocr_image and process_image.
+    """
+    mime, image_bytes = _maybe_downscale(image_bytes, mime)
+    return mime, base64.b64encode(image_bytes).decode("ascii")
+
+
+def _mime_for(filename: str) -> str:
+    """Guess an image MIME type from *filename*'s extension."""
+    return _MIME_MAP.get(os.path.splitext(filename)[1].lower(), "image/png")
 
 
 def image_to_data_url(image_path: str) -> str:
-    """Read an image file and return a base64 data URL."""
-    ext = os.path.splitext(image_path)[1].lower()
-    mime_map = {
-        ".jpg": "image/jpeg",
-        ".jpeg": "image/jpeg",
-        ".png": "image/png",
-        ".gif": "image/gif",
-        ".webp": "image/webp",
-        ".bmp": "image/bmp",
-    }
-    mime = mime_map.get(ext, "image/png")
+    """Read an image file and return a base64 data URL.
+
+    The file is memory-mapped, so images that need no downscaling are
+    base64-encoded straight from the page cache without a full-size copy.
+    """
+    mime = _mime_for(image_path)
     with open(image_path, "rb") as f:
-        b64 = base64.b64encode(f.read()).decode()
+        if os.fstat(f.fileno()).st_size == 0:
+            return f"data:{mime};base64,"
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            small = _downscaled(mm)
+            if small is not None:
+                mime = "image/jpeg"
+            b64 = base64.b64encode(mm if small is None else small).decode("ascii")
     return f"data:{mime};base64,{b64}"
 
 
+def get_sheets() -> SheetsClient:
+    """Return the shared SheetsClient, authorizing it on first use."""
+    global _SHEETS
+    if _SHEETS is None:
+        with _SHEETS_LOCK:
+            if _SHEETS is None:
+                _SHEETS = SheetsClient(SPREADSHEET_NAME, CREDENTIALS_PATH)
+    return _SHEETS
+
+
 def process_image(
-    image_input: str,
+    image_input: str | tuple[str, str],
+    sheets: SheetsClient,
     source: str = "upload",
-    sheets: SheetsClient | None = None,
+    use_cache: bool = True,
 ) -> dict:
     """Full pipeline: OCR → classify → route to logger or expenser.
 
     Args:
-        image_input: Either a file path or a base64 data URL.
+        image_input: A file path, a base64 data URL, or a ``(mime, base64)``
+            pair.
+        sheets: SheetsClient to write to, normally the shared get_sheets().
         source: Origin of the image (camera / upload / folder).
-        sheets: SheetsClient instance. If None, creates one from env.
+        use_cache: Reuse cached OCR / classification results for content
+            that was seen before.
 
     Returns:
         dict with action taken and details.
     """
-    if sheets is None:
-        sheets = SheetsClient(SPREADSHEET_NAME, CREDENTIALS_PATH)
-
     # Convert file path to data URL if needed
-    if not image_input.startswith("data:"):
-        image_data_url = image_to_data_url(image_input)
-    else:
-        image_data_url = image_input
+    if isinstance(image_input, str) and not image_input.startswith("data:"):
+        image_input = image_to_data_url(image_input)
 
     # Step 1: OCR
-    raw_text = ocr_image(image_data_url)
+    raw_text = ocr_image(image_input, use_cache=use_cache)
+
+    # Steps 2-3: Classify and route
+    return classify_and_route(
+        raw_text, source=source, sheets=sheets, use_cache=use_cache
+    )
+
+
+def classify_and_route(
+    raw_text: str,
+    source: str,
+    sheets: SheetsClient,
+    use_cache: bool = True,
+) -> dict:
+    """Classify OCR text and write it to the Expenses or Logs tab.
 
-    # Step 2: Classify
-    classification = classify_text(raw_text)
+    This is the second half of process_image, exposed separately so callers
+    can report the OCR text before classification finishes.
+    """
+    text = raw_text.strip()
+    if len(text) >= MIN_RECEIPT_CHARS and _RECEIPT_HINT_RE.search(text):
+        classification = classify_text(raw_text, use_cache=use_cache)
+    else:
+        classification = {"classification": "OTHER", "summary": None}
 
-    # Step 3: Route
     if classification.get("classification") == "RECEIPT":
         result = expense_receipt(sheets, classification, raw_text)
     else:
@@ -177,6 +449,16 @@ def process_image(
 app = Flask(__name__)
 
 
+def wants_cache() -> bool:
+    """False when the client sent ``Cache-Control: no-cache``."""
+    return "no-cache" not in request.headers.get("Cache-Control", "")
+
+
+def make_json_response(data, status: int = 200):
+    """Serialize *data* with orjson and return a Flask response tuple."""
+    return orjson.dumps(data), status, {"Content-Type": "application/json"}
+
+
 @app.route("/status", methods=["GET"])
 def status():
     return jsonify({"status": "ok", "service": "ocr-agent"})
@@ -192,18 +474,9 @@ def process_endpoint():
         file = request.files["file"]
         if not file.filename:
             return jsonify(error="Empty file"), 400
-        ext = os.path.splitext(file.filename)[1].lower()
-        mime_map = {
-            ".jpg": "image/jpeg",
-            ".jpeg": "image/jpeg",
-            ".png": "image/png",
-            ".gif": "image/gif",
-            ".webp": "image/webp",
-            ".bmp": "image/bmp",
-        }
-        mime = mime_map.get(ext, "image/png")
-        b64 = base64.b64encode(file.read()).decode()
-        image_input = f"data:{mime};base64,{b64}"
+        mime, image_bytes = _maybe_downscale_stream(file.stream, _mime_for(file.filename))
+        b64 = base64.b64encode(image_bytes).decode("ascii")
+        image_input = (mime, b64)
     else:
         # Handle JSON body
         data = request.get_json()
@@ -213,9 +486,10 @@ def process_endpoint():
         source = data.get("source", "upload")
 
     try:
-        sheets = SheetsClient(SPREADSHEET_NAME, CREDENTIALS_PATH)
-        result = process_image(image_input, source=source, sheets=sheets)
-        return jsonify(result)
+        result = process_image(
+            image_input, source=source, sheets=get_sheets(), use_cache=wants_cache()
+        )
+        return make_json_response(result)
     except requests.exceptions.ConnectionError:
         return jsonify(error="Cannot reach OCR server. Is local_server.py running on port 8080?"), 502
     except Exception as e:
@@ -236,8 +510,8 @@ def main():
             sys.exit(1)
         source = sys.argv[2] if len(sys.argv) > 2 else "cli"
         try:
-            result = process_image(image_path, source=source)
-            print(json.dumps(result, indent=2, ensure_ascii=False))
+            result = process_image(image_path, sheets=get_sheets(), source=source)
+            print(orjson.dumps(result, option=orjson.OPT_INDENT_2).decode())
         except Exception as e:
             print(f"Error: {e}")
             sys.exit(1)
@@ -248,7 +522,14 @@ def main():
         print(f"Running on http://0.0.0.0:{port}")
         print(f"POST /process  — process an image")
         print(f"GET  /status   — health check\n")
-        app.run(host="0.0.0.0", port=port, debug=False)
+        threads = int(os.environ.get("AGENT_THREADS", 8))
+        try:
+            from waitress import serve
+        except ImportError:
+            print("waitress not installed; falling back to the Flask dev server.")
+            app.run(host="0.0.0.0", port=port, debug=False, threaded=True)
+        else:
+            serve(app, host="0.0.0.0", port=port, threads=threads)
 
 
 if __name__ == "__main__":
@@ -12,15 +12,17 @@ Then open https://<your-ip>:5050 from any device on the LAN.
 Requires local_server.py to be running on port 8080.
 """
 
+import gzip
 import os
+import shutil
 import ssl
 import subprocess
 import json
+import orjson
 import requests
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 
-from agent import process_image
-from sheets_client import SheetsClient
+from agent import classify_and_route, encode_image_bytes, get_sheets, ocr_image, wants_cache
 
 app = Flask(__name__)
 
@@ -28,8 +30,6 @@ CERT_DIR = "/tmp/glmocr_ssl"
 CERT_FILE = os.path.join(CERT_DIR, "cert.pem")
 KEY_FILE = os.path.join(CERT_DIR, "key.pem")
 OCR_URL = "http://localhost:8080/v1/chat/completions"
-SPREADSHEET_NAME = os.environ.get("SPREADSHEET_NAME", "OCR Agent")
-CREDENTIALS_PATH = os.environ.get("GOOGLE_CREDENTIALS_PATH", None)
 
 HTML_PAGE = r"""<!DOCTYPE html>
 <html lang="en">
@@ -215,29 +215,44 @@ function capture() {
     canvas.height = video.videoHeight;
     canvas.getContext('2d').drawImage(video, 0, 0);
 
-    const dataUrl = canvas.toDataURL('image/png');
-    preview.src = dataUrl;
-    video.style.display = 'none';
-    preview.style.display = 'block';
-
     captureBtn.disabled = true;
     retakeBtn.style.display = 'inline-block';
     result.style.display = 'none';
     status.innerHTML = '<span class="spinner"></span> Processing (OCR + Agent)...';
 
+    canvas.toBlob(blob => {
+        preview.src = URL.createObjectURL(blob);
+        video.style.display = 'none';
+        preview.style.display = 'block';
+        upload(blob);
+    }, 'image/jpeg', 0.85);
+}
+
+function upload(blob) {
     fetch('/ocr', {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ image: dataUrl })
+        headers: { 'Content-Type': blob.type },
+        body: blob
     })
-    .then(r => r.json())
-    .then(data => {
-        status.textContent = '';
-        result.style.display = 'block';
-        if (data.error) {
-            result.innerHTML = '<p style="color:#f66">Error: ' + escapeHtml(data.error) + '</p>';
-        } else {
-            result.innerHTML = renderAgentResult(data);
+    .then(async r => {
+        if (!r.ok || !r.body) {
+            showResult(await r.json());
+            return;
+        }
+        // Server-Sent Events over the fetch body: OCR text first, then the result
+        const reader = r.body.getReader();
+        const decoder = new TextDecoder();
+        let buf = '';
+        for (;;) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buf += decoder.decode(value, { stream: true });
+            let sep;
+            while ((sep = buf.indexOf('\n\n')) >= 0) {
+                const frame = buf.slice(0, sep);
+                buf = buf.slice(sep + 2);
+                if (frame.startsWith('data: ')) handleEvent(JSON.parse(frame.slice(6)));
+            }
         }
     })
     .catch(err => {
@@ -247,7 +262,29 @@ function capture() {
     });
 }
 
+function handleEvent(ev) {
+    if (ev.stage === 'ocr') {
+        status.innerHTML = '<span class="spinner"></span> Classifying...';
+        result.style.display = 'block';
+        result.innerHTML = '<pre>' + escapeHtml(ev.raw_text) + '</pre>';
+    } else {
+        showResult(ev);
+    }
+}
+
+function showResult(data) {
+    status.textContent = '';
+    result.style.display = 'block';
+    if (data.error) {
+        result.innerHTML = '<p style="color:#f66">Error: ' + escapeHtml(data.error) + '</p>';
+    } else {
+        result.innerHTML = renderAgentResult(data);
+    }
+}
+
 function retake() {
+    if (preview.src.startsWith('blob:')) URL.revokeObjectURL(preview.src);
+    preview.removeAttribute('src');
     video.style.display = 'block';
     preview.style.display = 'none';
     captureBtn.disabled = false;
@@ -356,29 +393,76 @@ startCamera();
 """
 
 
+# The page is static, so compress it once at import instead of per request.
+_HTML_GZ = gzip.compress(HTML_PAGE.encode("utf-8"), 9)
+
+
 @app.route("/")
 def index():
+    if "gzip" in request.headers.get("Accept-Encoding", ""):
+        return _HTML_GZ, 200, {
+            "Content-Type": "text/html; charset=utf-8",
+            "Content-Encoding": "gzip",
+            "Cache-Control": "public, max-age=3600",
+            "Vary": "Accept-Encoding",
+        }
     return HTML_PAGE, 200, {"Content-Type": "text/html"}
 
 
-@app.route("/ocr", methods=["POST"])
-def ocr():
-    data = request.get_json()
-    if not data or "image" not in data:
-        return jsonify(error="No image provided"), 400
+def _sse_event(data: dict) -> bytes:
+    """Encode *data* as one Server-Sent Events frame."""
+    return b"data: " + orjson.dumps(data) + b"\n\n"
 
-    image_data_url = data["image"]
 
-    try:
-        sheets = SheetsClient(SPREADSHEET_NAME, CREDENTIALS_PATH)
-        result = process_image(image_data_url, source="camera", sheets=sheets)
-        return jsonify(result)
-    except requests.exceptions.ConnectionError:
-        return jsonify(error="Cannot reach OCR server on localhost:8080. Is local_server.py running?"), 502
-    except requests.exceptions.Timeout:
-        return jsonify(error="OCR server timed out"), 504
-    except Exception as e:
-        return jsonify(error=str(e)), 500
+@app.route("/ocr", methods=["POST"])
+def ocr():
+    """Process a captured photo sent as a raw binary body.
+
+    The image MIME type is the request ``Content-Type`` (e.g. ``image/jpeg``)
+    or, for ``application/octet-stream`` bodies, the ``X-Image-Mime`` header.
+    A JSON body of the form ``{"image": "<data URL>"}`` is still accepted.
+
+    Progress is streamed as Server-Sent Events: ``{"stage": "ocr", ...}``
+    with the raw text as soon as OCR finishes, then ``{"stage": "done", ...}``
+    with the agent result (or ``{"stage": "error", ...}``).
+    """
+    if request.is_json:
+        data = request.get_json()
+        if not data or "image" not in data:
+            return jsonify(error="No image provided"), 400
+        image = data["image"]
+    else:
+        image_bytes = request.get_data(cache=False)
+        if not image_bytes:
+            return jsonify(error="No image provided"), 400
+        mime = request.mimetype
+        if not mime.startswith("image/"):
+            mime = request.headers.get("X-Image-Mime", "image/jpeg")
+        image = encode_image_bytes(mime, image_bytes)
+        del image_bytes
+
+    use_cache = wants_cache()
+
+    def events():
+        try:
+            raw_text = ocr_image(image, use_cache=use_cache)
+            yield _sse_event({"stage": "ocr", "raw_text": raw_text})
+            result = classify_and_route(
+                raw_text, source="camera", sheets=get_sheets(), use_cache=use_cache
+            )
+            yield _sse_event({"stage": "done", **result})
+        except requests.exceptions.ConnectionError:
+            yield _sse_event({"stage": "error", "error": "Cannot reach OCR server on localhost:8080. Is local_server.py running?"})
+        except requests.exceptions.Timeout:
+            yield _sse_event({"stage": "error", "error": "OCR server timed out"})
+        except Exception as e:
+            yield _sse_event({"stage": "error", "error": str(e)})
+
+    return Response(
+        events(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 def generate_ssl_cert():
@@ -407,4 +491,20 @@ if __name__ == "__main__":
     print("Open https://<your-ip>:5050 from any device on the LAN")
     print("Accept the self-signed certificate warning in your browser.")
     print("Make sure local_server.py is running on port 8080.\n")
+    gunicorn = shutil.which("gunicorn")
+    if gunicorn and os.environ.get("FLASK_DEBUG") != "1":
+        # Hand the process over to gunicorn: a fixed thread pool with TLS,
+        # instead of Werkzeug's thread-per-request dev server.
+        threads = os.environ.get("CAMERA_THREADS", "8")
+        os.execvp(gunicorn, [
+            gunicorn,
+            "--chdir", os.path.dirname(os.path.abspath(__file__)),
+            "--bind", "0.0.0.0:5050",
+            "--worker-class", "gthread",
+            "--workers", "1",
+            "--threads", threads,
+            "--certfile", CERT_FILE,
+            "--keyfile", KEY_FILE,
+            "camera_app:app",
+        ])
     app.run(host="0.0.0.0", port=5050, ssl_context=(CERT_FILE, KEY_FILE), threaded=True)
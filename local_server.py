@@ -2,32 +2,132 @@
 
 Loads the model using transformers and serves /v1/chat/completions.
 Designed for testing — inference on CPU will be slow but functional.
+
+Set ``OCR_BACKEND=vllm`` to serve through vLLM's engine instead (requires a
+vLLM build for the host, e.g. its CPU backend).
 """
 
 import base64
+import gzip
+import hashlib
+import itertools
 import json
+import os
 import re
+import secrets
+import threading
 import time
-import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 
-import torch
-from flask import Flask, Response, jsonify, request
-from PIL import Image
-from transformers import AutoModelForImageTextToText, AutoProcessor
+# OpenMP/MKL read these when torch loads, so they are set before the import.
+# One thread per physical core (assuming 2-way SMT) avoids oversubscribing
+# the cores; the KMP_* settings apply when Intel's libiomp5 is preloaded.
+_NUM_THREADS = max(1, (os.cpu_count() or 2) // 2)
+os.environ.setdefault("OMP_NUM_THREADS", str(_NUM_THREADS))
+os.environ.setdefault("MKL_NUM_THREADS", str(_NUM_THREADS))
+os.environ.setdefault("KMP_AFFINITY", "granularity=fine,compact,1,0")
+os.environ.setdefault("KMP_BLOCKTIME", "1")
+
+import requests  # noqa: E402
+import torch  # noqa: E402
+from flask import Flask, Response, jsonify, request  # noqa: E402
+from PIL import Image  # noqa: E402
+from requests.adapters import HTTPAdapter  # noqa: E402
+from transformers import (  # noqa: E402
+    AutoModelForImageTextToText,
+    AutoProcessor,
+    DynamicCache,
+    TextIteratorStreamer,
+)
 
 MODEL_ID = "zai-org/GLM-OCR"
 
-print(f"Loading processor from {MODEL_ID}...")
-processor = AutoProcessor.from_pretrained(MODEL_ID)
+# "transformers" runs HF generate(); "vllm" uses vLLM's optimized engine.
+BACKEND = os.environ.get("OCR_BACKEND", "transformers")
 
-print(f"Loading model from {MODEL_ID} (bfloat16 on CPU)...")
-model = AutoModelForImageTextToText.from_pretrained(
-    MODEL_ID,
-    dtype=torch.bfloat16,
-    device_map="cpu",
-)
-model.eval()
+# OCR_INT8=1 stores the language decoder's Linear weights as INT8 (dynamic
+# quantization), halving the weight bytes streamed per generated token.
+USE_INT8 = os.environ.get("OCR_INT8") == "1"
+
+# OCR_COMPILE=1 captures the text decoder with torch.compile so per-token
+# Python dispatch is replaced by fused graph kernels.
+USE_COMPILE = os.environ.get("OCR_COMPILE") == "1"
+
+
+def _language_model(m) -> torch.nn.Module:
+    """Return the text decoder of an image-text-to-text model."""
+    lm = getattr(m, "language_model", None)
+    return lm if lm is not None else m.model.language_model
+
+
+torch.set_num_threads(int(os.environ["OMP_NUM_THREADS"]))
+
+
+# Upper bound on image pixels fed to the processor (transformers backend).
+MAX_IMAGE_PIXELS = None
+
+if BACKEND == "vllm":
+    from vllm import LLM, SamplingParams
+
+    print(f"Loading {MODEL_ID} with vLLM (transformers backend, bfloat16)...")
+    engine = LLM(model=MODEL_ID, model_impl="transformers", dtype="bfloat16")
+    # Sampling options for response_format={"type": "json_object"}
+    try:
+        from vllm.sampling_params import StructuredOutputsParams
+
+        JSON_MODE = {"structured_outputs": StructuredOutputsParams(json_object=True)}
+    except ImportError:  # vLLM before 0.10.2
+        from vllm.sampling_params import GuidedDecodingParams
+
+        JSON_MODE = {"guided_decoding": GuidedDecodingParams(json_object=True)}
+    # LLM.chat is not safe to call from several request threads at once
+    engine_lock = threading.Lock()
+else:
+    print(f"Loading processor from {MODEL_ID}...")
+    processor = AutoProcessor.from_pretrained(MODEL_ID)
+    # GLM's image processor expresses size["longest_edge"] as a maximum
+    # pixel count; anything larger would be resized by the processor anyway.
+    MAX_IMAGE_PIXELS = (getattr(processor.image_processor, "size", None) or {}).get("longest_edge")
+    # Prompt prefixes are only reused when they end on one of these tokens
+    SPECIAL_TOKEN_IDS = frozenset(processor.tokenizer.all_special_ids)
+
+    # Dynamically quantized Linear layers take float32 activations, so the
+    # INT8 variant keeps the rest of the model in float32 instead of bf16.
+    model_dtype = torch.float32 if USE_INT8 else torch.bfloat16
+    print(f"Loading model from {MODEL_ID} ({model_dtype} on CPU)...")
+    model = AutoModelForImageTextToText.from_pretrained(
+        MODEL_ID,
+        dtype=model_dtype,
+        device_map="cpu",
+    )
+    model.eval()
+
+    try:
+        import intel_extension_for_pytorch as ipex
+    except ImportError:
+        ipex = None
+
+    if USE_INT8:
+        # Only the text decoder is quantized; the vision encoder stays in
+        # floating point to avoid accuracy loss on the patch embeddings.
+        print("Quantizing language decoder Linear layers to INT8...")
+        torch.ao.quantization.quantize_dynamic(
+            _language_model(model), {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+        )
+    else:
+        # Intel Extension for PyTorch swaps in fused oneDNN BF16 kernels
+        # (AVX-512 BF16 / AMX where available); optional, skipped if missing.
+        if ipex is not None:
+            print("Optimizing model with Intel Extension for PyTorch (bfloat16)...")
+            model = ipex.optimize(model, dtype=torch.bfloat16, inplace=True)
+
+    if USE_COMPILE:
+        backend = "ipex" if ipex is not None else "inductor"
+        print(f"Compiling language decoder with torch.compile (backend={backend})...")
+        lm = _language_model(model)
+        lm.forward = torch.compile(lm.forward, backend=backend, dynamic=True)
 print("Model loaded successfully!")
 
 app = Flask(__name__)
@@ -116,6 +216,8 @@ const imageInput = document.getElementById('imageInput');
 const imagePreviewDiv = document.getElementById('imagePreview');
 let attachedImage = null;
 let history = [];
+// Identifies this chat to the server so it can keep its KV cache warm
+const sessionId = Date.now().toString(36) + Math.random().toString(36).slice(2);
 
 imageInput.addEventListener('change', function() {
     const file = this.files[0];
@@ -157,13 +259,19 @@ function addMessage(role, text, imageUrl) {
     return div;
 }
 
+// One pass over the text: HTML escapes, code blocks, inline code, bold, newlines
+const FORMAT_RE = /(&)|(<)|(>)|```(\w*)\n([\s\S]*?)```|`([^`]+)`|\*\*(.+?)\*\*|(\n)/g;
+const ESCAPES = {'&': '&amp;', '<': '&lt;', '>': '&gt;'};
+function escapeHtml(t) { return t.replace(/[&<>]/g, c => ESCAPES[c]); }
+
 function formatText(t) {
-    let h = t.replace(/&/g,'&amp;').replace(/</g,'&lt;').replace(/>/g,'&gt;');
-    h = h.replace(/```(\w*)\n([\s\S]*?)```/g, '<pre><code>$2</code></pre>');
-    h = h.replace(/`([^`]+)`/g, '<code>$1</code>');
-    h = h.replace(/\*\*(.+?)\*\*/g, '<strong>$1</strong>');
-    h = h.replace(/\n/g, '<br>');
-    return h;
+    return t.replace(FORMAT_RE, (m, amp, lt, gt, lang, block, code, bold) => {
+        if (block !== undefined) return '<pre><code>' + escapeHtml(block) + '</code></pre>';
+        if (code !== undefined) return '<code>' + escapeHtml(code) + '</code>';
+        if (bold !== undefined) return '<strong>' + formatText(bold) + '</strong>';
+        if (m === '\n') return '<br>';
+        return ESCAPES[m];
+    });
 }
 
 async function send() {
@@ -186,14 +294,36 @@ async function send() {
     const thinking = addMessage('assistant', '<span class="spinner"></span> Thinking...');
 
     try {
-        const resp = await fetch('/v1/chat/completions', {
+        const resp = await fetch('/v1/chat/completions?session_id=' + sessionId, {
             method: 'POST',
             headers: {'Content-Type': 'application/json'},
-            body: JSON.stringify({messages: history, max_tokens: 4096, temperature: 0.1})
+            body: JSON.stringify({messages: history, max_tokens: 4096, temperature: 0.1, stream: true})
         });
-        const data = await resp.json();
-        const reply = data.choices[0].message.content;
-        thinking.innerHTML = formatText(reply);
+        if (!resp.ok) throw new Error('HTTP ' + resp.status + ' ' + resp.statusText);
+        // Render the reply incrementally from the SSE token stream
+        const reader = resp.body.getReader();
+        const decoder = new TextDecoder();
+        let buf = '', reply = '';
+        for (;;) {
+            const {value, done} = await reader.read();
+            if (done) break;
+            buf += decoder.decode(value, {stream: true});
+            let sep;
+            while ((sep = buf.indexOf('\n\n')) >= 0) {
+                const line = buf.slice(0, sep);
+                buf = buf.slice(sep + 2);
+                if (!line.startsWith('data: ') || line === 'data: [DONE]') continue;
+                const event = JSON.parse(line.slice(6));
+                if (event.error) throw new Error(event.error.message);
+                const delta = event.choices[0].delta;
+                if (delta.content) {
+                    reply += delta.content;
+                    thinking.innerHTML = formatText(reply);
+                    messagesDiv.scrollTop = messagesDiv.scrollHeight;
+                }
+            }
+        }
+        if (!reply) throw new Error('The model returned an empty reply');
         history.push({role: 'assistant', content: reply});
     } catch(e) {
         thinking.innerHTML = '<span style="color:#f66">Error: ' + e.message + '</span>';
@@ -206,37 +336,197 @@ async function send() {
 </html>"""
 
 
+# The page is static, so encode and compress it once at import.
+CHAT_HTML_BYTES = CHAT_HTML.encode("utf-8")
+CHAT_HTML_GZ = gzip.compress(CHAT_HTML_BYTES, 9)
+
+
 @app.route("/")
 def index():
-    return CHAT_HTML, 200, {"Content-Type": "text/html"}
+    if "gzip" in request.headers.get("Accept-Encoding", ""):
+        return CHAT_HTML_GZ, 200, {
+            "Content-Type": "text/html; charset=utf-8",
+            "Content-Encoding": "gzip",
+            "Cache-Control": "public, max-age=3600",
+            "Vary": "Accept-Encoding",
+        }
+    return CHAT_HTML_BYTES, 200, {"Content-Type": "text/html; charset=utf-8"}
+
+
+# Remote images are fetched over pooled keep-alive connections, and the
+# images of one request are decoded in parallel.
+SESSION = requests.Session()
+SESSION.mount("http://", HTTPAdapter(pool_connections=16, pool_maxsize=32))
+SESSION.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=32))
+_DECODE_POOL = ThreadPoolExecutor(max_workers=8)
+
+
+def _fit_pixel_budget(img: Image.Image) -> Image.Image:
+    """Shrink *img* to at most MAX_IMAGE_PIXELS, keeping the aspect ratio.
+
+    Doing this up front (with Pillow's reducing thumbnail, SIMD-accelerated
+    under Pillow-SIMD) is much cheaper than letting the processor resample a
+    full-resolution photo, and hands it a smaller image to patchify.
+    """
+    if img.mode in ("1", "P"):
+        img = img.convert("RGB")
+    if MAX_IMAGE_PIXELS and img.width * img.height > MAX_IMAGE_PIXELS:
+        scale = (MAX_IMAGE_PIXELS / (img.width * img.height)) ** 0.5
+        size = (max(1, int(img.width * scale)), max(1, int(img.height * scale)))
+        img.thumbnail(size, Image.Resampling.LANCZOS)
+    return img.convert("RGB")
+
+
+# Decoded data-URI images. Chat clients resend the attached image with
+# every turn of the history, so it is decoded once rather than per request.
+_IMAGE_CACHE: OrderedDict[str, Image.Image] = OrderedDict()
+_IMAGE_CACHE_SIZE = 16
+_IMAGE_CACHE_LOCK = threading.Lock()
 
 
 def decode_image(url: str) -> Image.Image:
     """Decode an image from a data URI, file path, or URL."""
     if url.startswith("data:"):
+        # A short digest keeps megabyte-long URIs out of the cache keys
+        key = hashlib.blake2b(url.encode(), digest_size=16).hexdigest()
+        with _IMAGE_CACHE_LOCK:
+            img = _IMAGE_CACHE.get(key)
+            if img is not None:
+                _IMAGE_CACHE.move_to_end(key)
+        # Hand out copies: PIL images are mutable
+        if img is not None:
+            return img.copy()
+
         # data:image/png;base64,...
         header, b64data = url.split(",", 1)
         img_bytes = base64.b64decode(b64data)
-        return Image.open(BytesIO(img_bytes)).convert("RGB")
+        img = _fit_pixel_budget(Image.open(BytesIO(img_bytes)))
+        with _IMAGE_CACHE_LOCK:
+            _IMAGE_CACHE[key] = img
+            if len(_IMAGE_CACHE) > _IMAGE_CACHE_SIZE:
+                _IMAGE_CACHE.popitem(last=False)
+        return img.copy()
     elif url.startswith("file://"):
         path = url[7:]
-        return Image.open(path).convert("RGB")
+        img = Image.open(path)
     elif url.startswith(("http://", "https://")):
-        import requests as req
-        resp = req.get(url, timeout=30)
-        return Image.open(BytesIO(resp.content)).convert("RGB")
+        resp = SESSION.get(url, timeout=30)
+        img = Image.open(BytesIO(resp.content))
     else:
-        return Image.open(url).convert("RGB")
+        img = Image.open(url)
+    return _fit_pixel_budget(img)
+
+
+# Recently tokenized text-only prompts. The next turn of a chat renders to
+# the previous prompt plus the new messages, so only that suffix needs BPE.
+_PROMPT_CACHE: OrderedDict[str, torch.Tensor] = OrderedDict()
+_PROMPT_CACHE_SIZE = 32
+_PROMPT_CACHE_LOCK = threading.Lock()
+
+
+def _tokenize_text_prompt(text_input: str) -> dict:
+    """Tokenize a text-only prompt, reusing the ids of a cached prefix.
+
+    A prefix is only reused when its last token is a special token (such as
+    the chat template's generation prompt): BPE never merges across those,
+    so prefix + suffix ids match a full tokenization. Other prefixes could
+    merge differently with the suffix and are re-tokenized.
+    """
+    with _PROMPT_CACHE_LOCK:
+        prefix = max(
+            (
+                p
+                for p, ids in _PROMPT_CACHE.items()
+                if text_input.startswith(p) and int(ids[0, -1]) in SPECIAL_TOKEN_IDS
+            ),
+            key=len,
+            default=None,
+        )
+        prefix_ids = _PROMPT_CACHE[prefix] if prefix is not None else None
 
+    if prefix_ids is None:
+        input_ids = processor(text=[text_input], return_tensors="pt", padding=True)["input_ids"]
+    elif len(prefix) == len(text_input):
+        input_ids = prefix_ids
+    else:
+        suffix_ids = processor.tokenizer(
+            text_input[len(prefix):], add_special_tokens=False, return_tensors="pt"
+        )["input_ids"]
+        input_ids = torch.cat([prefix_ids, suffix_ids], dim=1)
+
+    with _PROMPT_CACHE_LOCK:
+        _PROMPT_CACHE[text_input] = input_ids
+        _PROMPT_CACHE.move_to_end(text_input)
+        if len(_PROMPT_CACHE) > _PROMPT_CACHE_SIZE:
+            _PROMPT_CACHE.popitem(last=False)
+    return {"input_ids": input_ids, "attention_mask": torch.ones_like(input_ids)}
+
+
+def _try_decode_image(url: str) -> Image.Image | None:
+    """decode_image, logging and returning None on failure."""
+    try:
+        return decode_image(url)
+    except Exception as e:
+        print(f"Failed to decode image: {e}", flush=True)
+        return None
+
+
+def _image_url(item: dict) -> str | None:
+    """Return the image URL of an ``image_url`` / ``image`` content item."""
+    # Handle both OpenAI format {"type":"image_url","image_url":{"url":...}}
+    # and simplified {"type":"image","image_url":{"url":...}}
+    if "image_url" in item and isinstance(item["image_url"], dict):
+        return item["image_url"].get("url")
+    return item.get("url")
+
+
+def _generate_vllm(
+    messages: list, max_tokens: int, temperature: float, json_mode: bool = False
+) -> tuple[str, int, int]:
+    """Run one chat completion through vLLM.
+
+    Images stay in the OpenAI ``image_url`` schema; vLLM decodes them itself.
+    With *json_mode*, decoding is constrained to a single JSON object. No
+    session KV cache is needed: vLLM's automatic prefix caching already
+    reuses the KV blocks of repeated prompt prefixes.
+    Returns ``(text, prompt_tokens, completion_tokens)``.
+    """
+    conversation = []
+    for msg in messages:
+        content = msg.get("content", "")
+        if isinstance(content, list):
+            parts = []
+            for item in content:
+                item_type = item.get("type", "")
+                if item_type == "text":
+                    parts.append({"type": "text", "text": item["text"]})
+                elif item_type in ("image_url", "image") and _image_url(item):
+                    parts.append({"type": "image_url", "image_url": {"url": _image_url(item)}})
+            content = parts
+        conversation.append({"role": msg.get("role", "user"), "content": content})
 
-@app.route("/v1/chat/completions", methods=["POST"])
-def chat_completions():
-    data = request.get_json()
-    messages = data.get("messages", [])
-    max_tokens = data.get("max_tokens", 4096)
-    temperature = data.get("temperature", 0.1)
+    params = SamplingParams(
+        max_tokens=max_tokens, temperature=temperature, **(JSON_MODE if json_mode else {})
+    )
+    with engine_lock:
+        output = engine.chat(conversation, sampling_params=params, use_tqdm=False)[0]
+    completion = output.outputs[0]
+    return completion.text, len(output.prompt_token_ids), len(completion.token_ids)
+
+
+def _prepare_inputs(messages: list) -> dict:
+    """Turn OpenAI-style *messages* into model inputs for generate()."""
+    # Decode all referenced images concurrently, then rebuild the
+    # conversation with placeholders for the ones that decoded
+    urls = [
+        _image_url(item)
+        for msg in messages
+        if isinstance(msg.get("content"), list)
+        for item in msg["content"]
+        if item.get("type") in ("image_url", "image") and _image_url(item)
+    ]
+    decoded = iter(list(_DECODE_POOL.map(_try_decode_image, urls)))
 
-    # Extract images and text from messages
     images = []
     conversation = []
 
@@ -253,65 +543,253 @@ def chat_completions():
                 if item_type == "text":
                     parts.append({"type": "text", "text": item["text"]})
                 elif item_type in ("image_url", "image"):
-                    # Handle both OpenAI format {"type":"image_url","image_url":{"url":...}}
-                    # and simplified {"type":"image","image_url":{"url":...}}
-                    img_url = None
-                    if "image_url" in item and isinstance(item["image_url"], dict):
-                        img_url = item["image_url"].get("url")
-                    elif "url" in item:
-                        img_url = item["url"]
-                    if img_url:
-                        try:
-                            img = decode_image(img_url)
+                    if _image_url(item):
+                        img = next(decoded)
+                        if img is not None:
                             images.append(img)
                             parts.append({"type": "image"})
-                        except Exception as e:
-                            print(f"Failed to decode image: {e}", flush=True)
                     else:
                         # type=image with no URL — just mark as image placeholder
                         parts.append({"type": "image"})
             conversation.append({"role": role, "content": parts})
 
-    # Apply chat template
+    # Apply chat template (transformers caches the compiled Jinja template)
     text_input = processor.apply_chat_template(
         conversation, tokenize=False, add_generation_prompt=True
     )
 
     # Process inputs
+    # Processor outputs are already CPU tensors, which is where the model runs
     if images:
-        inputs = processor(
+        return processor(
             text=[text_input],
             images=images,
             return_tensors="pt",
             padding=True,
         )
-    else:
-        inputs = processor(
-            text=[text_input],
-            return_tensors="pt",
-            padding=True,
-        )
+    return _tokenize_text_prompt(text_input)
+
+
+# generate() leaves per-call state on the model (GLM's multimodal rope_deltas,
+# read by every decode step), so calls are serialized. Each one already
+# keeps all cores busy.
+_GENERATE_LOCK = threading.Lock()
 
-    # Move to CPU (already there, but explicit)
-    inputs = {k: v.to("cpu") if hasattr(v, "to") else v for k, v in inputs.items()}
 
-    # Generate
-    with torch.no_grad():
-        output_ids = model.generate(
+def _reset_rope_deltas() -> None:
+    """Set the model's multimodal rotary offset to that of a text-only prompt.
+
+    A resumed session turn skips the prefill step that would recompute it, so
+    the offset left by the previous (possibly image) request must not leak in.
+    Text-only prompts use plain 0..n-1 positions, i.e. an offset of zero.
+    """
+    inner = getattr(model, "model", None)
+    if inner is not None and hasattr(inner, "rope_deltas"):
+        inner.rope_deltas = torch.zeros(1, 1, dtype=torch.long)
+
+
+def _run_generate(inputs: dict, max_tokens: int, temperature: float, **kwargs):
+    """Call model.generate() with the server's sampling and precision setup."""
+    cache = kwargs.get("past_key_values")
+    # bf16 autocast routes matmuls to oneDNN BF16 primitives
+    with _GENERATE_LOCK, torch.no_grad(), torch.autocast(
+        "cpu", dtype=torch.bfloat16, enabled=not USE_INT8
+    ):
+        if cache is not None and cache.get_seq_length():
+            _reset_rope_deltas()
+        return model.generate(
             **inputs,
             max_new_tokens=max_tokens,
             temperature=max(temperature, 0.01),
             do_sample=temperature > 0,
+            **kwargs,
         )
 
+
+# KV caches of recent multi-turn text chats, keyed by the client's
+# session_id. A new turn re-encodes only the tokens after the shared prefix.
+_SESSION_CACHES: OrderedDict[str, tuple[torch.Tensor, DynamicCache]] = OrderedDict()
+_SESSION_CACHE_SIZE = 4
+_SESSION_CACHE_LOCK = threading.Lock()
+
+
+def _take_session_cache(session_id: str | None, inputs: dict) -> DynamicCache | None:
+    """Return a KV cache to generate with for *session_id*, or None.
+
+    The session's stored cache is removed from the pool (so concurrent
+    requests never share it) and cropped to the prefix its tokens share with
+    the new prompt; a fresh cache is returned if nothing matches. Image
+    prompts are not cached: their multimodal rotary positions are computed
+    from the full prompt.
+    """
+    if session_id is None or "pixel_values" in inputs:
+        return None
+    with _SESSION_CACHE_LOCK:
+        entry = _SESSION_CACHES.pop(session_id, None)
+    if entry is None:
+        return DynamicCache()
+
+    cached_ids, cache = entry
+    input_ids = inputs["input_ids"]
+    # Keep at least one prompt token uncached so generate() has input
+    n = min(cached_ids.shape[1], input_ids.shape[1] - 1)
+    mismatch = (cached_ids[0, :n] != input_ids[0, :n]).nonzero()
+    shared = int(mismatch[0]) if len(mismatch) else n
+    if shared == 0:
+        return DynamicCache()
+    cache.crop(shared)
+    return cache
+
+
+def _store_session_cache(session_id: str, output_ids: torch.Tensor, cache: DynamicCache) -> None:
+    """Keep *cache* (covering *output_ids*' leading tokens) for the next turn."""
+    cached_ids = output_ids[:, : cache.get_seq_length()]
+    with _SESSION_CACHE_LOCK:
+        _SESSION_CACHES[session_id] = (cached_ids, cache)
+        _SESSION_CACHES.move_to_end(session_id)
+        if len(_SESSION_CACHES) > _SESSION_CACHE_SIZE:
+            _SESSION_CACHES.popitem(last=False)
+
+
+def _generate_transformers(
+    messages: list, max_tokens: int, temperature: float, session_id: str | None = None
+) -> tuple[str, int, int]:
+    """Run one chat completion through HF generate().
+
+    Returns ``(text, prompt_tokens, completion_tokens)``.
+    """
+    inputs = _prepare_inputs(messages)
+    cache = _take_session_cache(session_id, inputs)
+    if cache is None:
+        output_ids = _run_generate(inputs, max_tokens, temperature)
+    else:
+        output_ids = _run_generate(inputs, max_tokens, temperature, past_key_values=cache)
+        _store_session_cache(session_id, output_ids, cache)
+
     # Decode only new tokens
     input_len = inputs["input_ids"].shape[1]
     generated = output_ids[0][input_len:]
     text_output = processor.decode(generated, skip_special_tokens=True)
+    return text_output, input_len, len(generated)
+
+
+def _stream_transformers(
+    messages: list, max_tokens: int, temperature: float, session_id: str | None = None
+):
+    """Yield text pieces as HF generate() produces them.
+
+    Generation runs on a background thread; the output ids are only kept to
+    label the session's KV cache, if any. A generation failure is re-raised
+    once the pieces produced before it have been yielded.
+    """
+    inputs = _prepare_inputs(messages)
+    cache = _take_session_cache(session_id, inputs)
+    streamer = TextIteratorStreamer(
+        processor.tokenizer, skip_prompt=True, skip_special_tokens=True
+    )
+
+    def run():
+        try:
+            if cache is None:
+                _run_generate(inputs, max_tokens, temperature, streamer=streamer)
+            else:
+                output_ids = _run_generate(
+                    inputs, max_tokens, temperature, streamer=streamer, past_key_values=cache
+                )
+                _store_session_cache(session_id, output_ids, cache)
+        except Exception as e:
+            print(f"Generation failed: {e}", flush=True)
+            failures.append(e)
+            streamer.end()
+
+    failures = []
+    threading.Thread(target=run, daemon=True).start()
+    yield from streamer
+    if failures:
+        raise failures[0]
+
+
+# Completion ids only need to be unique per server run: a counter from a
+# random start avoids a urandom read per request.
+_COMPLETION_IDS = itertools.count(secrets.randbits(32))
+
+
+def _completion_id() -> str:
+    return f"chatcmpl-{next(_COMPLETION_IDS):08x}"
+
+
+def _sse_completion(
+    messages: list,
+    max_tokens: int,
+    temperature: float,
+    session_id: str | None,
+    json_mode: bool,
+):
+    """Yield an OpenAI ``chat.completion.chunk`` Server-Sent Events stream."""
+    completion_id = _completion_id()
+    created = int(time.time())
+
+    def chunk(delta: dict, finish_reason: str | None = None) -> str:
+        payload = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": "glm-ocr",
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+    yield chunk({"role": "assistant"})
+    try:
+        if BACKEND == "vllm":
+            # LLM.chat has no incremental output; send the reply as one chunk
+            text_output, _, _ = _generate_vllm(messages, max_tokens, temperature, json_mode)
+            yield chunk({"content": text_output})
+        else:
+            for piece in _stream_transformers(messages, max_tokens, temperature, session_id):
+                if piece:
+                    yield chunk({"content": piece})
+    except Exception as e:
+        # Headers are already sent, so the failure is reported in-band
+        error = {"error": {"message": str(e), "type": "server_error"}}
+        yield f"data: {json.dumps(error, ensure_ascii=False)}\n\n"
+    else:
+        yield chunk({}, "stop")
+    yield "data: [DONE]\n\n"
+
+
+@app.route("/v1/chat/completions", methods=["POST"])
+def chat_completions():
+    data = request.get_json()
+    messages = data.get("messages", [])
+    max_tokens = data.get("max_tokens", 4096)
+    temperature = data.get("temperature", 0.1)
+    # Clients holding a multi-turn chat pass a stable session_id so the
+    # server can reuse that chat's KV cache across turns.
+    session_id = request.args.get("session_id")
+    # JSON mode is enforced by the vLLM backend; HF generate() has no
+    # constrained decoding, so clients must still validate the reply.
+    json_mode = (data.get("response_format") or {}).get("type") == "json_object"
+
+    if data.get("stream"):
+        return Response(
+            _sse_completion(messages, max_tokens, temperature, session_id, json_mode),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache"},
+        )
+
+    if BACKEND == "vllm":
+        text_output, prompt_tokens, completion_tokens = _generate_vllm(
+            messages, max_tokens, temperature, json_mode
+        )
+    else:
+        text_output, prompt_tokens, completion_tokens = _generate_transformers(
+            messages, max_tokens, temperature, session_id
+        )
 
     # Format as OpenAI response
     resp = {
-        "id": f"chatcmpl-{uuid.uuid4().hex[:8]}",
+        "id": _completion_id(),
         "object": "chat.completion",
         "created": int(time.time()),
         "model": "glm-ocr",
@@ -323,9 +801,9 @@ def chat_completions():
             }
         ],
         "usage": {
-            "prompt_tokens": input_len,
-            "completion_tokens": len(generated),
-            "total_tokens": input_len + len(generated),
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
         },
     }
     return jsonify(resp)
@@ -336,5 +814,39 @@ def health():
     return jsonify({"status": "ok"})
 
 
+def _warmup() -> None:
+    """Run one tiny generation so torch.compile traces before the first request."""
+    buf = BytesIO()
+    Image.new("RGB", (224, 224), "white").save(buf, format="PNG")
+    url = "data:image/png;base64," + base64.b64encode(buf.getvalue()).decode("ascii")
+    messages = [
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": "OCR"},
+                {"type": "image_url", "image_url": {"url": url}},
+            ],
+        }
+    ]
+    _generate_transformers(messages, max_tokens=2, temperature=0.0)
+
+
+if BACKEND != "vllm" and USE_COMPILE:
+    print("Warming up compiled model...")
+    _warmup()
+    print("Warmup done.")
+
+
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=8080, debug=False)
+    # One process with a thread pool: every request shares the loaded model,
+    # and health checks, image fetches and token streams overlap inference.
+    # A pre-forking server would load the model once per worker (or fork a
+    # process whose OpenMP pool is already running).
+    threads = int(os.environ.get("OCR_SERVER_THREADS", 4))
+    try:
+        from waitress import serve
+    except ImportError:
+        print("waitress not installed; falling back to the Flask dev server.")
+        app.run(host="0.0.0.0", port=8080, debug=False, threaded=True)
+    else:
+        serve(app, host="0.0.0.0", port=8080, threads=threads, channel_timeout=600)
@@ -5,8 +5,10 @@ within a Google Spreadsheet.
 """
 
 import os
+import threading
 
 import gspread
+import orjson
 from google.oauth2.service_account import Credentials
 
 SCOPES = [
@@ -19,6 +21,13 @@ DEFAULT_CREDENTIALS_PATH = os.path.join(
 )
 
 
+def _cell(value):
+    """Render lists and dicts as compact JSON text for a spreadsheet cell."""
+    if isinstance(value, (list, dict)):
+        return orjson.dumps(value).decode()
+    return value
+
+
 class SheetsClient:
     """Thin wrapper around gspread for appending rows to named tabs."""
 
@@ -29,17 +38,52 @@ class SheetsClient:
         creds = Credentials.from_service_account_file(creds_path, scopes=SCOPES)
         self.gc = gspread.authorize(creds)
         self.spreadsheet = self.gc.open(spreadsheet_name)
+        # Resolved worksheets, so appends after the first skip the lookup call
+        self._ws_cache: dict[str, gspread.Worksheet] = {}
+        self._ws_lock = threading.Lock()
 
     def get_or_create_sheet(self, tab_name: str, headers: list[str]) -> gspread.Worksheet:
         """Return the worksheet named *tab_name*, creating it if needed."""
-        try:
-            ws = self.spreadsheet.worksheet(tab_name)
-        except gspread.exceptions.WorksheetNotFound:
-            ws = self.spreadsheet.add_worksheet(title=tab_name, rows=1000, cols=len(headers))
-            ws.append_row(headers, value_input_option="USER_ENTERED")
-        return ws
+        with self._ws_lock:
+            ws = self._ws_cache.get(tab_name)
+            if ws is not None:
+                return ws
+            try:
+                ws = self.spreadsheet.worksheet(tab_name)
+            except gspread.exceptions.WorksheetNotFound:
+                ws = self.spreadsheet.add_worksheet(title=tab_name, rows=1000, cols=len(headers))
+                ws.append_row(headers, value_input_option="USER_ENTERED")
+            self._ws_cache[tab_name] = ws
+            return ws
 
     def append_row(self, tab_name: str, headers: list[str], row_data: list) -> None:
         """Append a single row to *tab_name*, creating the sheet if needed."""
+        row = [_cell(v) for v in row_data]
+        self._write(
+            tab_name, headers, lambda ws: ws.append_row(row, value_input_option="USER_ENTERED")
+        )
+
+    def append_rows_batch(self, tab_name: str, headers: list[str], rows: list[list]) -> None:
+        """Append *rows* to *tab_name* in a single API call."""
+        if not rows:
+            return
+        cells = [[_cell(v) for v in row] for row in rows]
+        self._write(
+            tab_name, headers, lambda ws: ws.append_rows(cells, value_input_option="USER_ENTERED")
+        )
+
+    def _write(self, tab_name: str, headers: list[str], write) -> None:
+        """Call *write* with the tab's worksheet.
+
+        If the cached worksheet was deleted or renamed meanwhile, the call
+        fails; the tab is then looked up (or recreated) again and the write
+        retried once.
+        """
         ws = self.get_or_create_sheet(tab_name, headers)
-        ws.append_row(row_data, value_input_option="USER_ENTERED")
+        try:
+            write(ws)
+        except (gspread.exceptions.APIError, gspread.exceptions.WorksheetNotFound):
+            with self._ws_lock:
+                if self._ws_cache.get(tab_name) is ws:
+                    del self._ws_cache[tab_name]
+            write(self.get_or_create_sheet(tab_name, headers))
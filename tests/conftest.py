@@ -0,0 +1,27 @@
+"""pytest configuration for the top-level agent scripts."""
+
+import os
+
+import pytest
+
+# Tests marked ``model`` load GLM-OCR through local_server.py (several GB,
+# minutes on CPU), so they only run when explicitly requested.
+RUN_MODEL_TESTS = os.getenv("OCR_RUN_MODEL_TESTS", "0") == "1"
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers",
+        "model: test loads the GLM-OCR model (set OCR_RUN_MODEL_TESTS=1 to run)",
+    )
+
+
+def pytest_collection_modifyitems(config, items):
+    if RUN_MODEL_TESTS:
+        return
+    skip_model = pytest.mark.skip(
+        reason="Model test skipped. Set OCR_RUN_MODEL_TESTS=1 to run."
+    )
+    for item in items:
+        if "model" in item.keywords:
+            item.add_marker(skip_model)
@@ -0,0 +1,43 @@
+"""Unit tests for agent.py helpers (no OCR server or Google Sheets required)."""
+
+import base64
+from io import BytesIO
+
+from PIL import Image
+
+import agent
+
+
+def _decode(data_url: str) -> tuple[str, bytes]:
+    header, b64 = data_url.split(",", 1)
+    return header, base64.b64decode(b64)
+
+
+class TestImageToDataUrl:
+    def test_empty_file(self, tmp_path):
+        path = tmp_path / "empty.png"
+        path.write_bytes(b"")
+        assert agent.image_to_data_url(str(path)) == "data:image/png;base64,"
+
+    def test_tiny_non_image_is_sent_unchanged(self, tmp_path):
+        path = tmp_path / "tiny.jpg"
+        path.write_bytes(b"hi")
+        header, data = _decode(agent.image_to_data_url(str(path)))
+        assert header == "data:image/jpeg;base64"
+        assert data == b"hi"
+
+    def test_small_png_passes_through(self, tmp_path):
+        path = tmp_path / "small.png"
+        Image.new("RGB", (64, 32), "red").save(path)
+        header, data = _decode(agent.image_to_data_url(str(path)))
+        assert header == "data:image/png;base64"
+        assert data == path.read_bytes()
+
+    def test_large_image_is_downscaled_to_jpeg(self, tmp_path):
+        path = tmp_path / "large.png"
+        Image.new("RGB", (agent.MAX_IMAGE_SIDE * 2, agent.MAX_IMAGE_SIDE), "white").save(path)
+        header, data = _decode(agent.image_to_data_url(str(path)))
+        assert header == "data:image/jpeg;base64"
+        with Image.open(BytesIO(data)) as img:
+            assert img.format == "JPEG"
+            assert img.size == (agent.MAX_IMAGE_SIDE, agent.MAX_IMAGE_SIDE // 2)
@@ -0,0 +1,91 @@
+"""Tests for local_server.py against the real GLM-OCR model.
+
+How to run:
+    OCR_RUN_MODEL_TESTS=1 pytest -q tests/test_local_server.py
+"""
+
+import base64
+from io import BytesIO
+
+import pytest
+
+pytestmark = pytest.mark.model
+
+
+@pytest.fixture(scope="module")
+def server():
+    pytest.importorskip("torch")
+    import local_server
+
+    if local_server.BACKEND != "transformers":
+        pytest.skip("Requires the transformers backend")
+    return local_server
+
+
+def _text(role: str, text: str) -> dict:
+    return {"role": role, "content": [{"type": "text", "text": text}]}
+
+
+def _image_message() -> dict:
+    from PIL import Image, ImageDraw
+
+    img = Image.new("RGB", (320, 80), "white")
+    ImageDraw.Draw(img).text((10, 30), "TOTAL 12.50", fill="black")
+    buf = BytesIO()
+    img.save(buf, format="PNG")
+    url = "data:image/png;base64," + base64.b64encode(buf.getvalue()).decode()
+    return {
+        "role": "user",
+        "content": [
+            {"type": "image_url", "image_url": {"url": url}},
+            {"type": "text", "text": "Text Recognition:"},
+        ],
+    }
+
+
+class TestSessionCache:
+    def test_resumed_turn_matches_uncached_output(self, server):
+        """Greedy output is the same with and without the session KV cache."""
+        turn1 = [_text("user", "Name three colours.")]
+        reply, _, _ = server._generate_transformers(turn1, 16, 0.0, session_id="test")
+        assert "test" in server._SESSION_CACHES
+
+        # An image request in between leaves a non-zero rope offset behind
+        server._generate_transformers([_image_message()], 4, 0.0)
+
+        turn2 = turn1 + [_text("assistant", reply), _text("user", "Now name three animals.")]
+        cached, _, _ = server._generate_transformers(turn2, 16, 0.0, session_id="test")
+
+        server._SESSION_CACHES.clear()
+        uncached, _, _ = server._generate_transformers(turn2, 16, 0.0)
+        assert cached == uncached
+
+
+class TestStreaming:
+    def test_generation_failure_is_sent_as_error_event(self, server, monkeypatch):
+        def fail(*args, **kwargs):
+            raise RuntimeError("out of memory")
+
+        monkeypatch.setattr(server, "_run_generate", fail)
+        events = list(server._sse_completion([_text("user", "Hi")], 8, 0.0, None, False))
+        assert '"error"' in events[-2] and "out of memory" in events[-2]
+        assert events[-1] == "data: [DONE]\n\n"
+        assert not any('"finish_reason": "stop"' in e for e in events)
+
+
+class TestPromptCache:
+    def test_cached_prefix_matches_full_tokenization(self, server):
+        """Tokenizing via a cached prompt prefix gives the full tokenization's ids."""
+        turn1 = [{"role": "user", "content": "Name three colours."}]
+        turn2 = turn1 + [
+            {"role": "assistant", "content": "Red, green and blue."},
+            {"role": "user", "content": "  And three\nanimals?"},
+        ]
+        server._PROMPT_CACHE.clear()
+        for messages in (turn1, turn2):
+            text = server.processor.apply_chat_template(
+                messages, tokenize=False, add_generation_prompt=True
+            )
+            cached = server._tokenize_text_prompt(text)["input_ids"]
+            full = server.processor(text=[text], return_tensors="pt")["input_ids"]
+            assert cached.tolist() == full.tolist()
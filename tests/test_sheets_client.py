@@ -0,0 +1,81 @@
+"""Unit tests for SheetsClient (no Google credentials required)."""
+
+import threading
+from types import SimpleNamespace
+
+import gspread
+
+from sheets_client import SheetsClient
+
+
+def _api_error() -> gspread.exceptions.APIError:
+    error = {"code": 400, "message": "Unable to parse range: Logs", "status": "INVALID_ARGUMENT"}
+    return gspread.exceptions.APIError(SimpleNamespace(json=lambda: {"error": error}))
+
+
+class FakeWorksheet:
+    def __init__(self, spreadsheet, title):
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.rows = []
+
+    def _check(self):
+        if self.spreadsheet.tabs.get(self.title) is not self:
+            raise _api_error()
+
+    def append_row(self, row, value_input_option):
+        self._check()
+        self.rows.append(row)
+
+    def append_rows(self, rows, value_input_option):
+        self._check()
+        self.rows.extend(rows)
+
+
+class FakeSpreadsheet:
+    def __init__(self):
+        self.tabs = {}
+        self.lookups = 0
+
+    def worksheet(self, title):
+        self.lookups += 1
+        if title not in self.tabs:
+            raise gspread.exceptions.WorksheetNotFound(title)
+        return self.tabs[title]
+
+    def add_worksheet(self, title, rows, cols):
+        self.tabs[title] = FakeWorksheet(self, title)
+        return self.tabs[title]
+
+
+def _client() -> SheetsClient:
+    # Bypass __init__, which authorizes against Google
+    client = SheetsClient.__new__(SheetsClient)
+    client.spreadsheet = FakeSpreadsheet()
+    client._ws_cache = {}
+    client._ws_lock = threading.Lock()
+    return client
+
+
+class TestSheetsClient:
+    def test_worksheet_is_looked_up_once(self):
+        client = _client()
+        client.append_row("Logs", ["A"], [1])
+        client.append_rows_batch("Logs", ["A"], [[2], [3]])
+        assert client.spreadsheet.lookups == 1
+        assert client.spreadsheet.tabs["Logs"].rows == [["A"], [1], [2], [3]]
+
+    def test_list_cells_are_written_as_json(self):
+        client = _client()
+        client.append_row("Expenses", ["Items"], [[{"name": "Café", "price": 2}]])
+        assert client.spreadsheet.tabs["Expenses"].rows[-1] == ['[{"name":"Café","price":2}]']
+
+    def test_deleted_tab_is_recreated(self):
+        client = _client()
+        client.append_row("Logs", ["A"], [1])
+        del client.spreadsheet.tabs["Logs"]
+
+        client.append_rows_batch("Logs", ["A"], [[2]])
+        assert client.spreadsheet.tabs["Logs"].rows == [["A"], [2]]
+        client.append_row("Logs", ["A"], [3])
+        assert client.spreadsheet.tabs["Logs"].rows == [["A"], [2], [3]]
@@ -0,0 +1,169 @@
+"""Unit tests for the folder watcher (no Google Sheets or OCR server required)."""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+from PIL import Image, ImageDraw
+
+import watcher
+
+
+class FakeSheets:
+    """Records batched appends; fails the first *failures* calls."""
+
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.rows: list[tuple[str, list]] = []
+
+    def append_rows_batch(self, tab_name, headers, rows):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("quota exceeded")
+        self.rows.extend((tab_name, row) for row in rows)
+
+
+@pytest.fixture(autouse=True)
+def fast_flush(monkeypatch):
+    monkeypatch.setattr(watcher, "FLUSH_INTERVAL", 0.01)
+    monkeypatch.setattr(watcher, "FLUSH_BACKOFF", 0.01)
+    monkeypatch.setattr(watcher, "SETTLE_POLL", 0.01)
+
+
+@pytest.fixture
+def fake_pipeline(monkeypatch):
+    def process_image(filepath, source, sheets):
+        sheets.append_row("Logs", ["Raw Text"], [filepath])
+        return {"action": "logged", "summary": ""}
+
+    monkeypatch.setattr(watcher, "process_image", process_image)
+
+
+def _run(tmp_path, sheets):
+    image = tmp_path / "receipt.jpg"
+    image.write_bytes(b"\xff\xd8 not really a jpeg")
+    processed = tmp_path / "processed"
+    processed.mkdir()
+
+    writer = watcher.BatchedSheetsWriter(sheets)
+    handler = watcher.ImageHandler(str(processed), writer, pool=None)
+    try:
+        handler.handle(str(image))
+    finally:
+        writer.close()
+    return image, processed
+
+
+class TestBatchedSheetsWriter:
+    def test_rows_are_written_in_one_batch(self):
+        sheets = FakeSheets()
+        writer = watcher.BatchedSheetsWriter(sheets)
+        writer.append_row("Logs", ["A"], [1])
+        writer.append_row("Logs", ["A"], [2])
+        writer.wait_written()
+        writer.close()
+        assert sheets.rows == [("Logs", [1]), ("Logs", [2])]
+
+    def test_failed_write_is_retried(self):
+        sheets = FakeSheets(failures=watcher.FLUSH_RETRIES)
+        writer = watcher.BatchedSheetsWriter(sheets)
+        writer.append_row("Logs", ["A"], [1])
+        writer.wait_written()
+        writer.close()
+        assert sheets.rows == [("Logs", [1])]
+
+    def test_persistent_failure_is_raised(self):
+        writer = watcher.BatchedSheetsWriter(FakeSheets(failures=watcher.FLUSH_RETRIES + 1))
+        writer.append_row("Logs", ["A"], [1])
+        with pytest.raises(RuntimeError, match="quota"):
+            writer.wait_written()
+        writer.close()
+
+
+class TestImageHandler:
+    def test_image_is_moved_after_row_is_written(self, tmp_path, fake_pipeline):
+        sheets = FakeSheets()
+        image, processed = _run(tmp_path, sheets)
+        assert not image.exists()
+        assert (processed / "receipt.jpg").exists()
+        assert sheets.rows == [("Logs", [str(image)])]
+
+    def test_image_stays_when_sheets_write_fails(self, tmp_path, fake_pipeline):
+        sheets = FakeSheets(failures=watcher.FLUSH_RETRIES + 1)
+        image, processed = _run(tmp_path, sheets)
+        assert image.exists()
+        assert list(processed.iterdir()) == []
+        assert sheets.rows == []
+
+
+def _scan(path, text: str) -> None:
+    """Write an uncompressed page with blank margins and *text* mid-page."""
+    page = Image.new("RGB", (1240, 1754), "white")
+    ImageDraw.Draw(page).text((600, 870), text, fill="black")
+    page.save(path)
+
+
+class TestDuplicates:
+    @pytest.mark.parametrize("ext", [".bmp", ".tif"])
+    def test_same_sized_scans_are_not_duplicates(self, tmp_path, ext):
+        first, second = tmp_path / f"page1{ext}", tmp_path / f"page2{ext}"
+        _scan(first, "Invoice 1001")
+        _scan(second, "Invoice 1002")
+        assert first.stat().st_size == second.stat().st_size
+        assert watcher.file_fingerprint(str(first)) != watcher.file_fingerprint(str(second))
+
+    def test_identical_copy_is_a_duplicate(self, tmp_path):
+        first, copy = tmp_path / "page.bmp", tmp_path / "copy.bmp"
+        _scan(first, "Invoice 1001")
+        copy.write_bytes(first.read_bytes())
+        assert watcher.file_fingerprint(str(first)) == watcher.file_fingerprint(str(copy))
+
+    def test_both_scans_are_processed(self, tmp_path, fake_pipeline):
+        processed = tmp_path / "processed"
+        processed.mkdir()
+        pages = [tmp_path / "page1.bmp", tmp_path / "page2.bmp"]
+        _scan(pages[0], "Invoice 1001")
+        _scan(pages[1], "Invoice 1002")
+
+        sheets = FakeSheets()
+        writer = watcher.BatchedSheetsWriter(sheets)
+        handler = watcher.ImageHandler(str(processed), writer, pool=None)
+        try:
+            for page in pages:
+                handler.handle(str(page))
+        finally:
+            writer.close()
+        assert sheets.rows == [("Logs", [str(page)]) for page in pages]
+
+
+class TestWorkerPool:
+    def test_failure_after_processing_is_logged(self, tmp_path, monkeypatch, capsys):
+        def process_and_vanish(filepath, source, sheets):
+            os.remove(filepath)
+            return {"action": "logged", "summary": ""}
+
+        monkeypatch.setattr(watcher, "process_image", process_and_vanish)
+        image = tmp_path / "receipt.jpg"
+        image.write_bytes(b"\xff\xd8 not really a jpeg")
+        processed = tmp_path / "processed"
+        processed.mkdir()
+
+        pool = ThreadPoolExecutor(max_workers=1)
+        writer = watcher.BatchedSheetsWriter(FakeSheets())
+        handler = watcher.ImageHandler(str(processed), writer, pool)
+        handler.on_created(SimpleNamespace(is_directory=False, src_path=str(image)))
+        pool.shutdown(wait=True)
+        writer.close()
+
+        assert "[watcher] Error handling receipt.jpg" in capsys.readouterr().out
+        # The reserved destination is released again
+        assert list(processed.iterdir()) == []
+
+
+class TestReservePath:
+    def test_taken_names_get_a_suffix(self, tmp_path):
+        first = watcher.reserve_path(str(tmp_path), "a.jpg")
+        second = watcher.reserve_path(str(tmp_path), "a.jpg")
+        assert os.path.basename(first) == "a.jpg"
+        assert second != first and second.endswith(".jpg")
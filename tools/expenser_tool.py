@@ -3,7 +3,6 @@
 Columns: Timestamp | Vendor | Date | Items | Total | Payment Method | Raw Text
 """
 
-import json
 from datetime import datetime
 
 from sheets_client import SheetsClient
@@ -26,13 +25,11 @@ def expense_receipt(
     total = receipt_data.get("total", "Unknown")
     payment_method = receipt_data.get("payment_method", "Unknown")
 
-    # Format items as readable string for the spreadsheet cell
-    if isinstance(items, list):
-        items_str = json.dumps(items, ensure_ascii=False)
-    else:
-        items_str = str(items)
+    # A list of items is passed through as-is; SheetsClient serializes it to
+    # JSON for the cell when the row is written.
+    items_cell = items if isinstance(items, list) else str(items)
 
-    row = [timestamp, vendor, date, items_str, str(total), payment_method, raw_text]
+    row = [timestamp, vendor, date, items_cell, str(total), payment_method, raw_text]
     sheets.append_row(TAB_NAME, HEADERS, row)
 
     return {
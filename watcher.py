@@ -9,29 +9,223 @@ Usage:
     WATCH_DIR defaults to ./watch
 """
 
+import errno
+import hashlib
 import os
+import queue
 import shutil
 import sys
+import threading
 import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
 
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 
-from agent import process_image
+from agent import get_sheets, process_image
 from sheets_client import SheetsClient
 
 IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp", ".bmp", ".tiff", ".tif"}
 
-SPREADSHEET_NAME = os.environ.get("SPREADSHEET_NAME", "OCR Agent")
-CREDENTIALS_PATH = os.environ.get("GOOGLE_CREDENTIALS_PATH", None)
+# Sheets rows are buffered and written in one append per tab once either
+# limit is reached, instead of one API round-trip per image.
+FLUSH_INTERVAL = float(os.environ.get("SHEETS_FLUSH_INTERVAL", "5"))
+FLUSH_ROWS = int(os.environ.get("SHEETS_FLUSH_ROWS", "20"))
+# A failed batch write is retried this many times, backing off from
+# FLUSH_BACKOFF seconds, before its rows are reported as failed.
+FLUSH_RETRIES = 3
+FLUSH_BACKOFF = 1.0
+
+# Debounce: a new file is read once its size holds still across two polls
+SETTLE_POLL = 0.1
+SETTLE_TIMEOUT = 5.0
+
+# Duplicate detection hashes each whole file, read in chunks of this size
+HASH_CHUNK_BYTES = 1024 * 1024
+SEEN_HASHES_SIZE = 1024
+
+_STOP = object()
+
+
+class BatchedSheetsWriter:
+    """Drop-in for SheetsClient.append_row that batches writes.
+
+    Rows are queued and appended from a background thread every
+    FLUSH_INTERVAL seconds or FLUSH_ROWS rows, whichever comes first.
+    A thread that queued rows calls wait_written() to learn whether they
+    actually reached the sheet.
+    """
+
+    def __init__(self, sheets: SheetsClient):
+        self.sheets = sheets
+        self._queue: queue.Queue = queue.Queue()
+        self._local = threading.local()
+        self._thread = threading.Thread(target=self._run, name="sheets-writer", daemon=True)
+        self._thread.start()
+
+    def append_row(self, tab_name: str, headers: list[str], row_data: list) -> None:
+        future: Future = Future()
+        self._queue.put((tab_name, headers, row_data, future))
+        if not hasattr(self._local, "pending"):
+            self._local.pending = []
+        self._local.pending.append(future)
+
+    def wait_written(self) -> None:
+        """Block until the rows queued by this thread are written.
+
+        Raises the write error if any of them could not be written.
+        """
+        pending = getattr(self._local, "pending", [])
+        self._local.pending = []
+        for future in pending:
+            future.result()
+
+    def close(self) -> None:
+        """Write any buffered rows and stop the background thread."""
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def _run(self) -> None:
+        pending = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is not None and item is not _STOP:
+                pending.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + FLUSH_INTERVAL
+                if len(pending) < FLUSH_ROWS:
+                    continue
+
+            self._flush(pending)
+            pending = []
+            deadline = None
+            if item is _STOP:
+                return
+
+    def _flush(self, pending: list) -> None:
+        by_tab: dict[str, tuple[list[str], list[list], list[Future]]] = {}
+        for tab_name, headers, row_data, future in pending:
+            _, rows, futures = by_tab.setdefault(tab_name, (headers, [], []))
+            rows.append(row_data)
+            futures.append(future)
+        for tab_name, (headers, rows, futures) in by_tab.items():
+            error = self._write(tab_name, headers, rows)
+            for future in futures:
+                if error is None:
+                    future.set_result(None)
+                else:
+                    future.set_exception(error)
+
+    def _write(self, tab_name: str, headers: list[str], rows: list[list]) -> Exception | None:
+        """Append *rows* with retries; return the last error if all attempts fail."""
+        delay = FLUSH_BACKOFF
+        for attempt in range(FLUSH_RETRIES + 1):
+            try:
+                self.sheets.append_rows_batch(tab_name, headers, rows)
+                print(f"[watcher] Wrote {len(rows)} row(s) to {tab_name}")
+                return None
+            except Exception as e:
+                print(f"[watcher] Error writing {len(rows)} row(s) to {tab_name}: {e}")
+                if attempt == FLUSH_RETRIES:
+                    return e
+                time.sleep(delay)
+                delay *= 2
+
+
+def wait_until_stable(filepath: str) -> None:
+    """Block until *filepath* stops growing, or SETTLE_TIMEOUT passes."""
+    deadline = time.monotonic() + SETTLE_TIMEOUT
+    last = -1
+    while time.monotonic() < deadline:
+        try:
+            size = os.path.getsize(filepath)
+        except OSError:
+            size = -1
+        if size == last and size > 0:
+            return
+        last = size
+        time.sleep(SETTLE_POLL)
+
+
+def file_fingerprint(filepath: str) -> str:
+    """Return the SHA-256 of *filepath*'s contents.
+
+    The whole file is hashed: uncompressed scans of the same size can share
+    long identical runs (blank margins), and reading the file is cheap next
+    to an OCR call.
+    """
+    h = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        while chunk := f.read(HASH_CHUNK_BYTES):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def reserve_path(directory: str, filename: str) -> str:
+    """Atomically claim a free path for *filename* in *directory*.
+
+    Creates an empty placeholder with O_EXCL so concurrent workers never
+    pick the same name; the caller replaces it with the real file.
+    """
+    name, ext = os.path.splitext(filename)
+    dest = os.path.join(directory, filename)
+    attempt = 0
+    while True:
+        try:
+            os.close(os.open(dest, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return dest
+        except FileExistsError:
+            # Avoid overwriting: add a timestamp (and counter) suffix
+            suffix = f"_{int(time.time())}" + (f"_{attempt}" if attempt else "")
+            dest = os.path.join(directory, f"{name}{suffix}{ext}")
+            attempt += 1
+
+
+def _log_failure(filename: str, future: Future) -> None:
+    """Print an error that escaped ImageHandler.handle on a worker thread."""
+    if future.cancelled():
+        return
+    error = future.exception()
+    if error is not None:
+        print(f"[watcher] Error handling {filename}: {error}")
 
 
 class ImageHandler(FileSystemEventHandler):
     """Process new image files dropped into the watch directory."""
 
-    def __init__(self, processed_dir: str, sheets: SheetsClient):
+    def __init__(
+        self,
+        processed_dir: str,
+        sheets: BatchedSheetsWriter,
+        pool: ThreadPoolExecutor,
+    ):
         self.processed_dir = processed_dir
         self.sheets = sheets
+        # Files are processed off the observer thread so events keep draining;
+        # agent.ocr_image already caps in-flight OCR at OCR_CONCURRENCY.
+        self.pool = pool
+        # Fingerprints of recently processed files, oldest first
+        self._seen: OrderedDict[str, None] = OrderedDict()
+        self._seen_lock = threading.Lock()
+
+    def _check_seen(self, fingerprint: str) -> bool:
+        """Record *fingerprint*; return True if it was already seen."""
+        with self._seen_lock:
+            if fingerprint in self._seen:
+                self._seen.move_to_end(fingerprint)
+                return True
+            self._seen[fingerprint] = None
+            if len(self._seen) > SEEN_HASHES_SIZE:
+                self._seen.popitem(last=False)
+            return False
 
     def on_created(self, event):
         if event.is_directory:
@@ -41,37 +235,60 @@ class ImageHandler(FileSystemEventHandler):
         if ext not in IMAGE_EXTENSIONS:
             return
 
-        # Brief pause to let file writing finish
-        time.sleep(1)
+        future = self.pool.submit(self.handle, event.src_path)
+        future.add_done_callback(partial(_log_failure, os.path.basename(event.src_path)))
 
-        filepath = event.src_path
+    def handle(self, filepath: str) -> None:
+        """Debounce, OCR and file away one new image."""
         filename = os.path.basename(filepath)
+        wait_until_stable(filepath)
         print(f"[watcher] New image detected: {filename}")
 
         try:
-            result = process_image(filepath, source="folder", sheets=self.sheets)
-            action = result.get("action", "unknown")
-            print(f"[watcher] {filename} → {action}")
-
-            if result.get("action") == "expensed":
-                vendor = result.get("vendor", "?")
-                total = result.get("total", "?")
-                print(f"           Vendor: {vendor}, Total: {total}")
-            else:
-                summary = result.get("summary", "")
-                print(f"           Summary: {summary[:80]}")
-
-        except Exception as e:
-            print(f"[watcher] Error processing {filename}: {e}")
+            fingerprint = file_fingerprint(filepath)
+        except OSError as e:
+            print(f"[watcher] Error reading {filename}: {e}")
             return
 
+        if self._check_seen(fingerprint):
+            print(f"[watcher] {filename} → duplicate, skipping OCR")
+        else:
+            try:
+                result = process_image(filepath, source="folder", sheets=self.sheets)
+                # Only report and file the image away once its row is in the sheet
+                self.sheets.wait_written()
+                action = result.get("action", "unknown")
+                print(f"[watcher] {filename} → {action}")
+
+                if result.get("action") == "expensed":
+                    vendor = result.get("vendor", "?")
+                    total = result.get("total", "?")
+                    print(f"           Vendor: {vendor}, Total: {total}")
+                else:
+                    summary = result.get("summary", "")
+                    print(f"           Summary: {summary[:80]}")
+
+            except Exception as e:
+                print(f"[watcher] Error processing {filename}: {e}")
+                # Let a re-dropped copy of this file be retried
+                with self._seen_lock:
+                    self._seen.pop(fingerprint, None)
+                return
+
         # Move to processed folder
-        dest = os.path.join(self.processed_dir, filename)
-        # Avoid overwriting: add suffix if file exists
-        if os.path.exists(dest):
-            name, ext = os.path.splitext(filename)
-            dest = os.path.join(self.processed_dir, f"{name}_{int(time.time())}{ext}")
-        shutil.move(filepath, dest)
+        dest = reserve_path(self.processed_dir, filename)
+        try:
+            try:
+                # Same filesystem in the usual layout: a single rename(2)
+                os.replace(filepath, dest)
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    raise
+                shutil.move(filepath, dest)
+        except BaseException:
+            # Don't leave the empty placeholder looking like a filed image
+            os.unlink(dest)
+            raise
         print(f"[watcher] Moved to {dest}")
 
 
@@ -82,8 +299,9 @@ def main():
     os.makedirs(watch_dir, exist_ok=True)
     os.makedirs(processed_dir, exist_ok=True)
 
-    sheets = SheetsClient(SPREADSHEET_NAME, CREDENTIALS_PATH)
-    handler = ImageHandler(processed_dir, sheets)
+    writer = BatchedSheetsWriter(get_sheets())
+    pool = ThreadPoolExecutor(max_workers=os.cpu_count(), thread_name_prefix="watcher")
+    handler = ImageHandler(processed_dir, writer, pool)
 
     observer = Observer()
     observer.schedule(handler, watch_dir, recursive=False)
@@ -99,6 +317,9 @@ def main():
     except KeyboardInterrupt:
         observer.stop()
     observer.join()
+    # Finish in-flight images before flushing their rows
+    pool.shutdown(wait=True)
+    writer.close()
 
 
 if __name__ == "__main__":